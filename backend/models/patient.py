@@ -1,12 +1,46 @@
-from dateutil.relativedelta import relativedelta
+from functools import cached_property
+
 from django.db import models
+from django.db.models import Case, F, Func, Value, When
+from django.db.models.functions import Cast
 from django.utils import timezone
 from enumfields import Enum, EnumIntegerField
 
 from shared.models import AuditableModel
 
 
+class PatientQuerySet(models.QuerySet):
+    def with_age(self):
+        """ Annotate the queryset with `age_years` so `Patient.age` can be read without calculating
+            it in Python for each patient. Uses the DOB if there is one, else the `approx_age` field.
+        """
+        return self.annotate(
+            age_years=Case(
+                When(
+                    dob__isnull=False,
+                    then=Cast(
+                        Func(
+                            Func(
+                                Value(timezone.localdate(), output_field=models.DateField()),
+                                F('dob'),
+                                function='AGE',
+                                output_field=models.DurationField(),
+                            ),
+                            template='EXTRACT(YEAR FROM %(expressions)s)',
+                            output_field=models.FloatField(),
+                        ),
+                        models.IntegerField(),
+                    ),
+                ),
+                default=F('approx_age'),
+                output_field=models.IntegerField(),
+            ),
+        )
+
+
 class Patient(AuditableModel):
+    objects = PatientQuerySet.as_manager()
+
     mrn = models.CharField(max_length=128, verbose_name='medical record number', primary_key=True)
     first_name = models.CharField(max_length=256, blank=True)
     last_name = models.CharField(max_length=256, blank=True)
@@ -15,19 +49,24 @@ class Patient(AuditableModel):
     gender = EnumIntegerField(Gender, verbose_name='gender', default=Gender.UNKNOWN, blank=True, null=True)
 
     def __str__(self):
-        return f'{self.first_name} {self.last_name} (MRN: {self.mrn})'
+        return f'{self.name} (MRN: {self.mrn})'
 
     @property
     def age(self):
         """ Calculate age using DOB if possible, else use the `approx_age` field
         """
+        if hasattr(self, 'age_years'):
+            # Already calculated by `Patient.objects.with_age()`
+            return self.age_years if self.age_years is not None else '?'
         if self.dob:
-            now = timezone.make_naive(timezone.localtime())
-            return relativedelta(now, self.dob).years
+            today = timezone.localdate()
+            # Subtract a year if their birthday hasn't happened yet this year
+            return today.year - self.dob.year - ((today.month, today.day) < (self.dob.month, self.dob.day))
         if self.approx_age:
             return self.approx_age
         return '?'
 
-    @property
+    @cached_property
     def name(self):
+        # Cached for the lifetime of the instance, so it won't reflect later changes to the name fields
         return f'{self.first_name} {self.last_name}'
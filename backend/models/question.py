@@ -1,6 +1,9 @@
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
 from django.db import models
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
 
 from enumfields import Enum, EnumIntegerField
 
@@ -65,14 +68,85 @@ class Question(AuditableModel):
     # when getting data from  user created questions for charts, dashboards etc.
     label = models.SlugField(max_length=100, unique=True, blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['speciality', 'category']),
+        ]
+
     def __str__(self):
         return self.title
 
 
+# Questions are rarely edited, so lookups about them are kept in the shared cache for an hour
+QUESTION_CACHE_TIMEOUT = 60 * 60
+
+
+def _question_type_cache_key(question_id):
+    return f'question-type-{question_id}'
+
+
+def question_type(question_id):
+    """ Return the type of the question with id `question_id`.
+        Cached across processes, and cleared whenever the question is saved or deleted.
+    """
+    key = _question_type_cache_key(question_id)
+    type_value = cache.get(key)
+    if type_value is None:
+        type_value = Question.objects.values_list('type', flat=True).get(pk=question_id).value
+        cache.set(key, type_value, QUESTION_CACHE_TIMEOUT)
+    return QuestionType(type_value)
+
+
+def _question_id_cache_key(label):
+    return f'question-id-{label}'
+
+
+def question_id_for_label(label):
+    """ Return the id of the question with label `label`, cached like `question_type`.
+        Used by charts and dashboards which fetch data for user created questions by label.
+    """
+    key = _question_id_cache_key(label)
+    question_id = cache.get(key)
+    if question_id is None:
+        question_id = Question.objects.values_list('pk', flat=True).get(label=label)
+        cache.set(key, question_id, QUESTION_CACHE_TIMEOUT)
+    return question_id
+
+
+@receiver([post_save, post_delete], sender=Question)
+def clear_question_type_cache(sender, instance, **kwargs):
+    cache.delete(_question_type_cache_key(instance.pk))
+
+
+@receiver(pre_save, sender=Question)
+def clear_old_question_label_cache(sender, instance, **kwargs):
+    # The label may be about to change, so clear the cached id for the label it's saved with now
+    if instance.pk:
+        old_label = Question.objects.filter(pk=instance.pk).values_list('label', flat=True).first()
+        if old_label:
+            cache.delete(_question_id_cache_key(old_label))
+
+
+@receiver(post_delete, sender=Question)
+def clear_question_label_cache(sender, instance, **kwargs):
+    if instance.label:
+        cache.delete(_question_id_cache_key(instance.label))
+
+
+class QuestionGroupQuerySet(models.QuerySet):
+    def with_content_objects(self):
+        """ Prefetch each group's parent object with one query per content type, rather than
+            one per group. Use this whenever `content_object` is read while iterating over groups.
+        """
+        return self.prefetch_related('content_object')
+
+
 class QuestionGroup(OrderableModel, AuditableModel):
     """ A QuestionGroup is used to group Questions together and associate
         them with a parent object (Syndrome, Diagnosis, etc.) through a generic foreign key.
     """
+    objects = QuestionGroupQuerySet.as_manager()
+
     title = models.CharField(max_length=256, null=True, blank=True)
     category = EnumIntegerField(QuestionCategory)
     questions = models.ManyToManyField(
@@ -95,6 +169,10 @@ class QuestionGroup(OrderableModel, AuditableModel):
                 name='issues_can_only_have_one_question_group',
             )
         ]
+        indexes = [
+            # For looking up the question groups of a parent object (by category)
+            models.Index(fields=['content_type', 'object_id', 'category'], name='questiongroup_object_cat_idx'),
+        ]
 
     def __str__(self):
         return self.title or '(no title)'
@@ -1,11 +1,39 @@
+from functools import lru_cache
+
 from django.apps import apps
-from django.db import models
+from django.db import models, transaction
 
 from shared.models import AuditableModel
 from .investigation import InvestigationStatus, InvestigationStatusLabel
 from .people_present import PeoplePresent
 from .mixins.has_question_groups import HasQuestionGroupsMixin
 
+DEFAULT_PEOPLE_PRESENT = (
+    'Patient',
+    'Husband',
+    'Wife',
+    'Son',
+    'Daughter',
+    'Mother',
+    'Father',
+    'Family',
+)
+
+DEFAULT_INVESTIGATION_STATUSES = (
+    ('Required', InvestigationStatus.REQUIRED),
+    ('Ordered', InvestigationStatus.ORDERED),
+    ('Done', InvestigationStatus.DONE),
+    ('Follow up with GP', InvestigationStatus.OUTPATIENT),
+)
+
+DEFAULT_FOLLOW_UP_TIME_OPTIONS = (
+    '<undecided>',
+    '2 weeks',
+    '4 weeks',
+    '6 weeks',
+    '3 months',
+)
+
 
 class Speciality(AuditableModel, HasQuestionGroupsMixin):
     title = models.CharField(max_length=256)
@@ -22,46 +50,29 @@ class Speciality(AuditableModel, HasQuestionGroupsMixin):
         is_new = not self.pk
         add_initial_data = kwargs.pop('add_initial_data', True)
 
-        super().save(*args, **kwargs)
+        # Save the speciality and its default data in a single transaction
+        with transaction.atomic():
+            super().save(*args, **kwargs)
 
-        if is_new and add_initial_data:
-            self._add_default_data()
+            if is_new and add_initial_data:
+                self._add_default_data()
 
     def _add_default_data(self):
-        people_present = [
-            'Patient',
-            'Husband',
-            'Wife',
-            'Son',
-            'Daughter',
-            'Mother',
-            'Father',
-            'Family',
-        ]
         PeoplePresent.objects.bulk_create([
-            PeoplePresent(title=person, speciality=self) for person in people_present
+            PeoplePresent(title=person, speciality=self) for person in DEFAULT_PEOPLE_PRESENT
         ])
-
-        investigation_statuses = [
-            {'title': 'Required', 'status': InvestigationStatus.REQUIRED},
-            {'title': 'Ordered', 'status': InvestigationStatus.ORDERED},
-            {'title': 'Done', 'status': InvestigationStatus.DONE},
-            {'title': 'Follow up with GP', 'status': InvestigationStatus.OUTPATIENT},
-        ]
         InvestigationStatusLabel.objects.bulk_create([
-            InvestigationStatusLabel(speciality=self, **status) for status in investigation_statuses
+            InvestigationStatusLabel(speciality=self, title=title, status=status)
+            for (title, status) in DEFAULT_INVESTIGATION_STATUSES
         ])
-
-        follow_up_time_options = [
-            '<undecided>',
-            '2 weeks',
-            '4 weeks',
-            '6 weeks',
-            '3 months',
-        ]
-
-        # Use apps.get_model to avoid circular import issues
-        FollowUpTime = apps.get_model('stays', 'FollowUpTime')
+        FollowUpTime = _follow_up_time_model()
         FollowUpTime.objects.bulk_create([
-            FollowUpTime(speciality=self, title=title, order=i) for (i, title) in enumerate(follow_up_time_options)
+            FollowUpTime(speciality=self, title=title, order=i)
+            for (i, title) in enumerate(DEFAULT_FOLLOW_UP_TIME_OPTIONS)
         ])
+
+
+@lru_cache(maxsize=None)
+def _follow_up_time_model():
+    # Use apps.get_model to avoid circular import issues
+    return apps.get_model('stays', 'FollowUpTime')
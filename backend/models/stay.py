@@ -1,17 +1,20 @@
-from django.db import models
+from django.db import models, transaction
+from django.utils import timezone
 
 from shared.models import AuditableModel
 
 from .diagnosis import Diagnosis
 from .doctor import Doctor
 from .patient import Patient
+from .question import Question
+from .stay_answer import AUDIT_FIELDS, StayAnswer, VALUE_FIELD_FOR_QUESTION_TYPE
 from .syndrome import Syndrome
 
-from ..querysets import NeurologyStayQuerySet
+from ..querysets import NeurologyStayQuerySet, StayQuerySet
 
 
 class Stay(AuditableModel):
-    objects = models.Manager()
+    objects = StayQuerySet.as_manager()
     # Custom manager that can be used to annotate Stays with Neurology specific data
     neurology_stays = NeurologyStayQuerySet.as_manager()
 
@@ -29,6 +32,14 @@ class Stay(AuditableModel):
     other_diagnosis_title = models.CharField(max_length=256, blank=True, null=True)
     other_diagnosis_selected = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            # For listing a patient's active stays
+            models.Index(fields=['patient', 'active']),
+            # For filtering stays by admission date e.g. in the stroke charts
+            models.Index(fields=['admission_time']),
+        ]
+
     def __str__(self):
         return f'{self.id}: {self.patient.last_name}'
 
@@ -36,25 +47,130 @@ class Stay(AuditableModel):
         """ Update the answer value and notes associated with question `question_id`.
         """
         stay_answer, _ = self.answers.get_or_create(question_id=question_id)
+
+        changed_fields = []
         if answer:
-            stay_answer.set_value(answer)
+            value_field = stay_answer.set_value(answer)
+            if value_field:
+                changed_fields.append(value_field)
         if notes:
             stay_answer.notes = notes
-        stay_answer.save()
+            changed_fields.append('notes')
+
+        # List answers' choices are saved by `set_value`, but their audit fields still need saving
+        if answer or notes:
+            stay_answer.save(update_fields=changed_fields + AUDIT_FIELDS)
+
+    def set_answers(self, answers):
+        """ Bulk version of `set_answer` taking an iterable of `(question_id, answer, notes)` tuples.
+
+            Uses a fixed number of queries however many answers are set. As with any bulk operation,
+            `StayAnswer.save()` isn't called. Raises `Question.DoesNotExist` for unknown question ids.
+        """
+        answers = list(answers)
+        question_ids = [question_id for (question_id, _, _) in answers]
+
+        value_fields = {
+            question_id: VALUE_FIELD_FOR_QUESTION_TYPE[type]
+            for (question_id, type)
+            in Question.objects.filter(pk__in=question_ids).values_list('pk', 'type')
+        }
+        missing_ids = set(question_ids) - value_fields.keys()
+        if missing_ids:
+            raise Question.DoesNotExist(f'No questions with ids {sorted(missing_ids)}')
+
+        with transaction.atomic():
+            # Lock the existing answers so concurrent `set_answer` calls can't be overwritten below
+            existing_answers = list(
+                StayAnswer.objects.select_for_update().filter(stay=self, question_id__in=question_ids)
+            )
+            stay_answers = {stay_answer.question_id: stay_answer for stay_answer in existing_answers}
+
+            new_answers = []
+            updated_answers = {}  # Existing answers with changes to save, keyed by question id
+            updated_fields = set()
+            selected_choices = {}  # List answers' choices, keyed by question id
+            for question_id, answer, notes in answers:
+                stay_answer = stay_answers.get(question_id)
+                if not stay_answer:
+                    stay_answer = StayAnswer(stay=self, question_id=question_id)
+                    stay_answers[question_id] = stay_answer
+                    new_answers.append(stay_answer)
+                elif answer or notes:
+                    updated_answers[question_id] = stay_answer
+
+                value_field = value_fields[question_id]
+                if answer:
+                    if value_field == 'list_value':
+                        selected_choices[question_id] = answer
+                    else:
+                        setattr(stay_answer, value_field, answer)
+                        updated_fields.add(value_field)
+                if notes:
+                    stay_answer.notes = notes
+                    updated_fields.add('notes')
+
+            # New answers get their ids back from Postgres, which the list choices below rely on
+            StayAnswer.objects.bulk_create(new_answers, batch_size=500)
+            if updated_answers:
+                # `bulk_update` doesn't call `save()`, so set the update time it would have set.
+                # There's no user to record here, so `updated_by` is left as it was.
+                now = timezone.now()
+                for stay_answer in updated_answers.values():
+                    stay_answer.updated_at = now
+                StayAnswer.objects.bulk_update(
+                    updated_answers.values(), [*updated_fields, 'updated_at'], batch_size=500,
+                )
+
+            if selected_choices:
+                # Replace the selected choices of all list answers with one delete and one insert
+                ListChoice = StayAnswer.list_value.through
+                ListChoice.objects.filter(
+                    stayanswer__in=[stay_answers[question_id] for question_id in selected_choices],
+                ).delete()
+                ListChoice.objects.bulk_create([
+                    ListChoice(
+                        stayanswer_id=stay_answers[question_id].id,
+                        questionchoice_id=getattr(choice, 'pk', choice),
+                    )
+                    for (question_id, choices) in selected_choices.items()
+                    for choice in choices
+                ], batch_size=500)
+
+    def get_answers(self):
+        """ Return the stay's answers with everything needed to read their values fetched up front.
+        """
+        return self.answers.with_values()
 
     @property
-    def ward_round(self):
+    def current_ward_round(self):
+        """ Return the current WardRound object if there is an active one, else None.
+            Uses the ward rounds prefetched by `Stay.objects.with_open_ward_rounds()` if available.
+        """
+        if hasattr(self, 'open_ward_rounds'):
+            return self.open_ward_rounds[-1] if self.open_ward_rounds else None
+
+        return self.wardround_set.filter(complete=False).order_by('pk').last()
+
+    def ensure_ward_round(self):
         """ Return the current WardRound object if there is an active one,
             else create a new one.
         """
-        ward_round = self.wardround_set.last()
-        if ward_round and not ward_round.complete:
+        ward_round = self.current_ward_round
+        if ward_round:
             return ward_round
 
-        return self.wardround_set.create()
+        ward_round = self.wardround_set.create()
+        if hasattr(self, 'open_ward_rounds'):
+            # Keep the prefetched ward rounds current so the new one isn't created again
+            self.open_ward_rounds.append(ward_round)
+        return ward_round
 
     @property
     def diagnosis_title(self):
+        if hasattr(self, 'computed_diagnosis_title'):
+            # Already calculated by `Stay.objects.with_diagnosis_title()`
+            return self.computed_diagnosis_title
         if self.other_diagnosis_selected:
             return self.other_diagnosis_title
         if self.diagnosis:
@@ -2,18 +2,64 @@ from django.db import models
 
 from shared.models import AuditableModel
 from .base.answer import AnswerBase
-from .question import Question, QuestionChoice
+from .question import Question, QuestionChoice, QuestionType, question_type
+
+# The field each question type stores its answer in (both text types share `text_value`)
+VALUE_FIELD_FOR_QUESTION_TYPE = {
+    QuestionType.BOOLEAN: 'boolean_value',
+    QuestionType.TEXT: 'text_value',
+    QuestionType.LONG_TEXT: 'text_value',
+    QuestionType.TIMESTAMP: 'timestamp_value',
+    QuestionType.DATE: 'date_value',
+    QuestionType.NUMBER: 'number_value',
+    QuestionType.CHOICE: 'choice_value',
+    QuestionType.LIST: 'list_value',
+}
+
+# The AuditableModel fields to write along with any partial update of an answer
+AUDIT_FIELDS = ['updated_at', 'updated_by']
+
+
+class StayAnswerQuerySet(models.QuerySet):
+    def with_values(self):
+        """ Fetch everything needed to read the answers' values: the question and selected choice
+            are joined and all selected list choices are loaded in one extra query.
+
+            Always prefetch on the queryset rather than calling `answer.list_value.all()` per answer,
+            which would issue a query for every answer.
+        """
+        return self.select_related('question', 'choice_value').prefetch_related('list_value')
+
+    def for_display(self):
+        """ Only load the columns needed to show the answers: their values and notes, the
+            question's type (which determines the value field to read) and the selected choices' titles.
+        """
+        return self.select_related('question', 'choice_value').prefetch_related('list_value').only(
+            'id',
+            'stay_id',
+            'question__type',
+            'notes',
+            'boolean_value',
+            'text_value',
+            'timestamp_value',
+            'date_value',
+            'number_value',
+            'choice_value',
+            'choice_value__title',
+        )
 
 
 class StayAnswer(AnswerBase, AuditableModel):
     """ A model for a stay's answers to questions.
     """
+    objects = StayAnswerQuerySet.as_manager()
+
     stay = models.ForeignKey('Stay', on_delete=models.CASCADE, related_name='answers')
     question = models.ForeignKey(Question, on_delete=models.PROTECT)
     notes = models.TextField(blank=True, null=True)
 
     # All possible value types
-    boolean_value = models.NullBooleanField(blank=True)
+    boolean_value = models.BooleanField(null=True, blank=True)
     text_value = models.TextField(blank=True, null=True)
     timestamp_value = models.DateTimeField(null=True, blank=True)
     date_value = models.DateField(null=True, blank=True)
@@ -23,31 +69,40 @@ class StayAnswer(AnswerBase, AuditableModel):
 
     class Meta:
         unique_together = ('stay', 'question')
+        indexes = [
+            # For `answered_yes` filters e.g. excluding stays transferred back
+            models.Index(
+                fields=['question', 'stay'],
+                condition=models.Q(boolean_value=True),
+                name='stayanswer_yes_idx',
+            ),
+        ]
 
     @property
     def _value_field(self):
         """ Returns the name of the field where the answer is stored based on the question type.
             e.g. for a question with type=QuestionType.BOOLEAN, returns `boolean_value`
+            Uses the cached question type unless the question has already been loaded.
         """
-        type_str = self.question.get_type_display()
-
-        # Map all text fields to the `text_value` column
-        if type_str in ('text', 'long_text'):
-            type_str = 'text'
-
-        return f'{type_str}_value'
+        if StayAnswer.question.is_cached(self):
+            return VALUE_FIELD_FOR_QUESTION_TYPE[self.question.type]
+        return VALUE_FIELD_FOR_QUESTION_TYPE[question_type(self.question_id)]
 
     @property
     def value(self):
         return getattr(self, self._value_field)
 
     def set_value(self, value):
+        """ Set the answer's value. Returns the name of the field that needs saving
+            e.g. for `save(update_fields=[...])`, or None if the value has already been saved.
+        """
         value_field = self._value_field
 
         if value_field == 'list_value':
-            # Update the ManyToMany choice relationship using `list_value.set`
+            # Update the ManyToMany choice relationship using `list_value.set`, which saves it immediately
             self.list_value.set(value)
+            return None
 
-        else:
-            # Update standard fields using `setattr`
-            setattr(self, self._value_field, value)
+        # Update standard fields using `setattr`
+        setattr(self, value_field, value)
+        return value_field
@@ -1,4 +1,5 @@
 from datetime import timedelta
+from functools import lru_cache
 
 from django.apps import apps
 from django.db import models
@@ -13,9 +14,7 @@ from django.db.models import (
     Value,
     When,
 )
-from django.db.models.fields import Field
 from django.db.models.functions import TruncDate
-from django.db.models.lookups import BuiltinLookup
 
 from stays.helpers.question_labels import question_labels_to_type
 from stays.helpers.stroke_diagnoses import STROKE_DIAGNOSES
@@ -26,9 +25,50 @@ from stays.models.neurology import NBM
 from stays.models.nihss import NIHSS
 from stays.models.question import QuestionType
 from stays.models.stage import Stage
+from stays.models.stay_answer import VALUE_FIELD_FOR_QUESTION_TYPE
 
+# Medications count towards a category if they're being taken or have been contraindicated
+TAKING_OR_CONTRAINDICATED = (TakingMedication.YES, TakingMedication.CONTRAINDICATED)
 
-class NeurologyStayQuerySet(models.QuerySet):
+# Anticoagulants and antiplatelets are both antithrombotics
+ANTITHROMBOTIC_CATEGORY_Q = (
+    Q(medication__category__title__iexact='anticoagulation therapy status') |
+    Q(medication__category__title__iexact='antiplatelet therapy status')
+)
+
+
+class StayQuerySet(models.QuerySet):
+    def with_related(self):
+        """ Join the related objects used when listing stays (e.g. by `Stay.__str__` and `Stay.diagnosis_title`)
+            to avoid a query per stay for each of them.
+        """
+        return self.select_related('patient', 'doctor', 'syndrome', 'diagnosis')
+
+    def with_diagnosis_title(self):
+        """ Annotate the queryset with `computed_diagnosis_title`, the database equivalent of `Stay.diagnosis_title`.
+        """
+        return self.annotate(
+            computed_diagnosis_title=Case(
+                When(other_diagnosis_selected=True, then=F('other_diagnosis_title')),
+                default=F('diagnosis__title'),
+                output_field=models.CharField(),
+            ),
+        )
+
+    def with_open_ward_rounds(self):
+        """ Prefetch each stay's incomplete ward rounds so `Stay.current_ward_round` doesn't need a query per stay.
+        """
+        WardRound = apps.get_model('stays', 'WardRound')
+        return self.prefetch_related(
+            Prefetch(
+                'wardround_set',
+                queryset=WardRound.objects.filter(complete=False).order_by('pk'),
+                to_attr='open_ward_rounds',
+            )
+        )
+
+
+class NeurologyStayQuerySet(StayQuerySet):
     """ A custom QuerySet to simplify accessing all Neurology/Stroke specific data.
 
         It has several helper methods that annotate a a stay queryset with stroke specific data
@@ -63,8 +103,7 @@ class NeurologyStayQuerySet(models.QuerySet):
             and we use the `question_answer` method to generate the right subquery based on the label
             i.e. convert it to `atrial_fibrillation=question_answer('nel-atrial-fibrillation')`
         """
-        fields = {field: question_answer(question_label) for (field, question_label) in kwargs.items()}
-        return self.annotate(**fields)
+        return self.annotate(**question_annotations(**kwargs))
 
     def with_correct_meds_data(self):
         """ Annotate the queryset with the `on_correct_meds` value. This value only makes sense for stroke stays.
@@ -89,7 +128,7 @@ class NeurologyStayQuerySet(models.QuerySet):
                 .filter(
                     stay_id=OuterRef('id'),
                     medication__category__title__iexact=category_title,
-                    medication__taking__in=[TakingMedication.YES, TakingMedication.CONTRAINDICATED],
+                    medication__taking__in=TAKING_OR_CONTRAINDICATED,
                 )
             )
 
@@ -141,40 +180,56 @@ class NeurologyStayQuerySet(models.QuerySet):
             on_antihypertensives=on_med_category('antihypertensive therapy'),
             on_antiplatelets=on_med_category('antiplatelet therapy status'),
             on_statins=on_med_category('statin therapy'),
-            on_antithrombotics=(Case(
-                When(on_anticoagulants=True, then=Value(True)),
-                When(on_antiplatelets=True, then=Value(True)),
-                default=Value(False),
-                output_field=models.BooleanField(),
-            )),
+            # A single `Exists` over both categories, rather than a `Case` over `on_anticoagulants`
+            # and `on_antiplatelets` which would repeat both of their subqueries
+            on_antithrombotics=Exists(
+                StayCurrentMedication
+                .objects
+                .filter(
+                    ANTITHROMBOTIC_CATEGORY_Q,
+                    stay_id=OuterRef('id'),
+                    medication__taking__in=TAKING_OR_CONTRAINDICATED,
+                )
+            ),
             not_on_antithrombotics=(~Exists(
                 StayCurrentMedication
                 .objects
                 .filter(
-                    Q(medication__category__title__iexact='anticoagulation therapy status') |
-                    Q(medication__category__title__iexact='antiplatelet therapy status'),
+                    ANTITHROMBOTIC_CATEGORY_Q,
                     stay_id=OuterRef('id'),
                     medication__taking=TakingMedication.YES
                 )
             )),
             # Annotate with the "on correct meds" value based on the stay's diagnosis
             # and the meds they're taking
+            # Referencing an annotation inlines its whole expression, so `has_af` (and the diagnosis check)
+            # are each referenced once in nested `Case`s rather than repeated in separate `When`s
             on_correct_meds=(Case(
                 When(
                     diagnosis__title__icontains='ischaemic stroke',
-                    has_af=True,
-                    on_anticoagulants=True,
-                    on_antihypertensives=True,
-                    on_statins=True,
-                    then=Value(True),
-                ),
-                When(
-                    diagnosis__title__icontains='ischaemic stroke',
-                    has_af=False,
-                    on_antihypertensives=True,
-                    on_antithrombotics=True,
-                    on_statins=True,
-                    then=Value(True),
+                    then=Case(
+                        When(
+                            has_af=True,
+                            then=Case(
+                                When(
+                                    on_anticoagulants=True,
+                                    on_antihypertensives=True,
+                                    on_statins=True,
+                                    then=Value(True),
+                                ),
+                                default=Value(False),
+                                output_field=models.BooleanField(),
+                            ),
+                        ),
+                        When(
+                            on_antihypertensives=True,
+                            on_antithrombotics=True,
+                            on_statins=True,
+                            then=Value(True),
+                        ),
+                        default=Value(False),
+                        output_field=models.BooleanField(),
+                    ),
                 ),
                 When(
                     diagnosis__title='Intracerebral haemorrhage',
@@ -189,23 +244,25 @@ class NeurologyStayQuerySet(models.QuerySet):
 
     def with_hyperacute_report_data(self):
         # TODO new /hyperacute-status endpoint that pulls in the data as necessary?
-        return self.with_questions(
-            doctors_involved='nel-doctors-involved',
-            presentation_type='nel-presentation-type',
-            hyperacute_review='nel-hyperacute-review',
-            local_site_doctor_used_asap='nel-local-site-doctor-used-asap',
-            first_contact_made_prior_to_ct='nel-first-contact-made-prior-to-patient-going-to-ct',
-            reasons_not_thrombolysed='nel-reasons-not-thrombolysed',
-            other_reasons_not_given_thrombolysis='nel-other-reasons-not-given-thrombolysis',
-            reasons_not_sent_for_ecr='nel-reasons-not-sent-for-ecr',
-            other_reasons_not_sent_for_ecr='nel-other-reasons-not-sent-for-ecr',
-            time_of_first_neurology_contact='nel-time-of-first-nel-contact',
-            time_of_acute_imaging_starting='nel-time-of-acute-imaging-starting',
-            time_of_lysis_treatment_decision='nel-time-of-lysis-treatment-decision',
-            # TODO "Door to ..." times can't be annotated like
-            #      door_to_alert = F('time_of_first_neurology_contact') - F('admission_time')
-            #      due to this Django bug: https://code.djangoproject.com/ticket/31133
-        ).annotate(
+        # The question answers and other values are added in a single `annotate` so the query is only cloned once
+        return self.annotate(
+            **question_annotations(
+                doctors_involved='nel-doctors-involved',
+                presentation_type='nel-presentation-type',
+                hyperacute_review='nel-hyperacute-review',
+                local_site_doctor_used_asap='nel-local-site-doctor-used-asap',
+                first_contact_made_prior_to_ct='nel-first-contact-made-prior-to-patient-going-to-ct',
+                reasons_not_thrombolysed='nel-reasons-not-thrombolysed',
+                other_reasons_not_given_thrombolysis='nel-other-reasons-not-given-thrombolysis',
+                reasons_not_sent_for_ecr='nel-reasons-not-sent-for-ecr',
+                other_reasons_not_sent_for_ecr='nel-other-reasons-not-sent-for-ecr',
+                time_of_first_neurology_contact='nel-time-of-first-nel-contact',
+                time_of_acute_imaging_starting='nel-time-of-acute-imaging-starting',
+                time_of_lysis_treatment_decision='nel-time-of-lysis-treatment-decision',
+                # TODO "Door to ..." times can't be annotated like
+                #      door_to_alert = F('time_of_first_neurology_contact') - F('admission_time')
+                #      due to this Django bug: https://code.djangoproject.com/ticket/31133
+            ),
             needle_time=F('thrombolysis__bolus_time'),
             last_seen_well=F('presentation__last_seen_well'),
             last_seen_well_time=F('presentation__lsw_time'),
@@ -218,34 +275,35 @@ class NeurologyStayQuerySet(models.QuerySet):
             These values are used in generating the Hyperacute report card, in the stroke charts,
             and in the data viz.
         """
-        return self.with_questions(
-            doctors_involved='nel-doctors-involved',
-            presentation_type='nel-presentation-type',
-            hyperacute_review='nel-hyperacute-review',
-            time_of_first_neurology_contact='nel-time-of-first-nel-contact',
-            time_of_acute_imaging_starting='nel-time-of-acute-imaging-starting',
-            time_of_lysis_treatment_decision='nel-time-of-lysis-treatment-decision',
-            reasons_not_thrombolysed='nel-reasons-not-thrombolysed',
-            other_reasons_not_given_thrombolysis='nel-other-reasons-not-given-thrombolysis',
-            reasons_not_sent_for_ecr='nel-reasons-not-sent-for-ecr',
-            other_reasons_not_sent_for_ecr='nel-other-reasons-not-sent-for-ecr',
-            reviewed_by_stroke_nurse_in_ed='nel-reviewed-by-stroke-nurse-in-ed',
-            time_transferred_out_of_ed='nel-time-transferred-out-of-ed',
-            local_site_doctor_used_asap='nel-local-site-doctor-used-asap',
-            swallow_status='nel-swallow-status',
-            my_stroke_journey_given='nel-my-stroke-journey-given',
-            follow_up_nihss='nel-follow-up-nihss',
-            infectious_contact_precautions='nel-infectious-contact-precautions',
-            reg_present_at_time_of_patient_arrival='nel-reg-present-at-time-of-patient-arrival',
-            first_contact_made_prior_to_ct='nel-first-contact-made-prior-to-patient-going-to-ct',
-            time_of_ecr_treatment_decision='nel-time-of-ecr-treatment-decision',
-            admitted_to_icu='nel-admitted-to-icu',
-            days_in_icu='nel-days-in-icu',
-            admitted_to_ccu='nel-admitted-to-ccu',
-            days_in_ccu='nel-days-in-ccu',
-            transferred_back_gt_1week_onset='nel-transferred-gt-1week-onset',
-            transferred_to_other_center='nel-transferred-to-other-center',
-        ).annotate(
+        return self.annotate(
+            **question_annotations(
+                doctors_involved='nel-doctors-involved',
+                presentation_type='nel-presentation-type',
+                hyperacute_review='nel-hyperacute-review',
+                time_of_first_neurology_contact='nel-time-of-first-nel-contact',
+                time_of_acute_imaging_starting='nel-time-of-acute-imaging-starting',
+                time_of_lysis_treatment_decision='nel-time-of-lysis-treatment-decision',
+                reasons_not_thrombolysed='nel-reasons-not-thrombolysed',
+                other_reasons_not_given_thrombolysis='nel-other-reasons-not-given-thrombolysis',
+                reasons_not_sent_for_ecr='nel-reasons-not-sent-for-ecr',
+                other_reasons_not_sent_for_ecr='nel-other-reasons-not-sent-for-ecr',
+                reviewed_by_stroke_nurse_in_ed='nel-reviewed-by-stroke-nurse-in-ed',
+                time_transferred_out_of_ed='nel-time-transferred-out-of-ed',
+                local_site_doctor_used_asap='nel-local-site-doctor-used-asap',
+                swallow_status='nel-swallow-status',
+                my_stroke_journey_given='nel-my-stroke-journey-given',
+                follow_up_nihss='nel-follow-up-nihss',
+                infectious_contact_precautions='nel-infectious-contact-precautions',
+                reg_present_at_time_of_patient_arrival='nel-reg-present-at-time-of-patient-arrival',
+                first_contact_made_prior_to_ct='nel-first-contact-made-prior-to-patient-going-to-ct',
+                time_of_ecr_treatment_decision='nel-time-of-ecr-treatment-decision',
+                admitted_to_icu='nel-admitted-to-icu',
+                days_in_icu='nel-days-in-icu',
+                admitted_to_ccu='nel-admitted-to-ccu',
+                days_in_ccu='nel-days-in-ccu',
+                transferred_back_gt_1week_onset='nel-transferred-gt-1week-onset',
+                transferred_to_other_center='nel-transferred-to-other-center',
+            ),
             needle_time=F('thrombolysis__bolus_time'),
             is_lysis=F('diagnosis__is_thrombolysis'),
         )
@@ -255,14 +313,14 @@ class NeurologyStayQuerySet(models.QuerySet):
 
         return (
             self
-            .with_questions(
-                # Annotate with Data Capture answers that are relevant to stroke unit access
-                admitted_to_icu='nel-admitted-to-icu',
-                days_in_icu='nel-days-in-icu',
-                admitted_to_ccu='nel-admitted-to-ccu',
-                days_in_ccu='nel-days-in-ccu',
-            )
             .annotate(
+                # Annotate with Data Capture answers that are relevant to stroke unit access
+                **question_annotations(
+                    admitted_to_icu='nel-admitted-to-icu',
+                    days_in_icu='nel-days-in-icu',
+                    admitted_to_ccu='nel-admitted-to-ccu',
+                    days_in_ccu='nel-days-in-ccu',
+                ),
                 # Admitted to the stroke unit if the stay has been in a stroke bed
                 admitted_to_stroke_unit=Exists(
                     Location.objects.filter(stay_id=OuterRef('id'), is_stroke_bed=True),
@@ -299,53 +357,43 @@ class NeurologyStayQuerySet(models.QuerySet):
 
     def exclude_transferred_back(self):
         return (
-            self.with_questions(
-                transferred_back_gt_1week_onset='nel-transferred-gt-1week-onset',
-                transferred_to_other_center='nel-transferred-to-other-center',
-            )
-            .exclude(
-                Q(transferred_back_gt_1week_onset__isnull=False) &
-                Q(transferred_back_gt_1week_onset=True)
-            )
-            .exclude(
-                Q(transferred_to_other_center__isnull=False) &
-                Q(transferred_to_other_center=True)
-            )
+            self
+            .filter(~answered_yes('nel-transferred-gt-1week-onset'))
+            .filter(~answered_yes('nel-transferred-to-other-center'))
         )
 
     def exclude_isolated_for_infectious_contact_precautions(self):
-        return (
-            self
-            .with_questions(
-                infectious_contact_precautions='nel-infectious-contact-precautions',
-            )
-            .exclude(
-                Q(infectious_contact_precautions__isnull=False) &
-                Q(infectious_contact_precautions=True),
-            )
-        )
+        return self.filter(~answered_yes('nel-infectious-contact-precautions'))
 
     def exclude_palliative(self):
-        """ Exclude Stays that are currently marked palliative
+        """ Exclude Stays that are currently marked palliative i.e. their latest care classification
+            is PALLIATIVE_PATHWAY.
         """
         return (
             self
-            .annotate(
-                current_care_classification=Subquery(
+            .filter(
+                # Written as NOT EXISTS (rather than annotating each stay with its latest classification)
+                # so Postgres can plan it as a single anti-join
+                ~Exists(
                     StayCareClassification
                     .objects
                     .filter(
-                        stay_id=OuterRef('id')
+                        stay_id=OuterRef('id'),
+                        classification=CareClassification.PALLIATIVE_PATHWAY,
+                    )
+                    .exclude(
+                        # There's a later classification for the stay (the last added wins on the same date)
+                        Exists(
+                            StayCareClassification
+                            .objects
+                            .filter(
+                                Q(date__gt=OuterRef('date')) | Q(date=OuterRef('date'), pk__gt=OuterRef('pk')),
+                                stay_id=OuterRef('stay_id'),
+                            )
+                        )
                     )
-                    .order_by('-date')
-                    [:1]
-                    .values('classification')
                 ),
             )
-            .exclude(
-                Q(current_care_classification__isnull=False) &
-                Q(current_care_classification=CareClassification.PALLIATIVE_PATHWAY),
-            )
         )
 
     def exclude_palliative_in_first_24_hours(self):
@@ -355,9 +403,11 @@ class NeurologyStayQuerySet(models.QuerySet):
                 # `admission_date` is used for checking if care classification=PALLIATIVE_PATHWAY in first 24 hours
                 # TruncDate preserves the timezone
                 admission_date=TruncDate('admission_time'),
+            )
+            .filter(
                 # Palliative in the 1st 24 hours if the stay has a palliative care classification
                 # that was set on the day of admission or the next day
-                palliative_in_first_24_hours=Exists(
+                ~Exists(
                     StayCareClassification
                     .objects
                     .filter(
@@ -365,34 +415,11 @@ class NeurologyStayQuerySet(models.QuerySet):
                         classification=CareClassification.PALLIATIVE_PATHWAY,
                         date__lte=OuterRef('admission_date') + timedelta(days=1),
                     )
-                )
-            )
-            .exclude(
-                Q(palliative_in_first_24_hours__isnull=False) &
-                Q(palliative_in_first_24_hours=True),
+                ),
             )
         )
 
 
-class Any(BuiltinLookup):
-    """ Custom database lookup for Postgres' `ANY` lookup
-        Postgres docs: https://www.postgresql.org/docs/9.1/arrays.html
-        e.g. `SELECT * FROM sal_emp WHERE 10000 = ANY (pay_by_quarter);`
-             returns all rows when any value in `pay_by_quarter` is 10000
-
-        We use it to get QuestionChoices associated with an answer. The answer stores the
-        list of IDs in an array and we filter QuestionChoices against this array to get the selected
-        choices and their titles.
-    """
-    lookup_name = 'any'
-
-    def get_rhs_op(self, connection, rhs):
-        return ' = ANY(%s)' % (rhs,)
-
-
-Field.register_lookup(Any)
-
-
 class Array(Subquery):
     """ Custom Subquery to return multiple values as an array. We use it to get
         all question titles associated with a QuestionType.LIST question i.e.
@@ -401,6 +428,15 @@ class Array(Subquery):
     template = 'ARRAY(%(subquery)s)'
 
 
+def question_annotations(**kwargs):
+    """ Return a dict of annotations for the answers to multiple questions, where the `kwargs` are
+        in the form `field=question_label` (see `NeurologyStayQuerySet.with_questions`).
+
+        Useful for adding the answers in the same `annotate` call as other values.
+    """
+    return {field: question_answer(question_label) for (field, question_label) in kwargs.items()}
+
+
 def question_answer(question_label):
     """ Return a subquery that will get the answer for the stay for the question with the
         specified `question_label`.
@@ -409,6 +445,9 @@ def question_answer(question_label):
             Stay.objects.annotate(
                 admitted_to_icu=question_answer('nel-admitted-to-icu')
             )
+
+        The subqueries are cached per label (see `generic_q` etc.), which is safe because Django
+        copies an expression before resolving it against a query, so the cached instance is never modified.
     """
     question_type = question_labels_to_type[question_label]
     if question_type == QuestionType.LIST:
@@ -418,26 +457,41 @@ def question_answer(question_label):
     return generic_q(question_label, question_type)
 
 
+def answered_yes(question_label):
+    """ Return an `Exists` subquery to check if the stay answered True to the question with the
+        specified `question_label`.
+
+        Use this rather than `question_answer` when filtering, e.g. `.filter(~answered_yes(...))`.
+        The answer isn't added to the SELECT and Postgres can plan the negated form as an anti-join.
+    """
+    StayAnswer = apps.get_model('stays', 'StayAnswer')
+    value_field = VALUE_FIELD_FOR_QUESTION_TYPE[question_labels_to_type[question_label]]
+    return Exists(
+        StayAnswer
+        .objects
+        .filter(stay_id=OuterRef('id'), question__label=question_label, **{value_field: True})
+    )
+
+
+@lru_cache(maxsize=None)
 def generic_q(label, type):
     """ Annotate the stay with the value selected for the question with label == `label`.
     """
     StayAnswer = apps.get_model('stays', 'StayAnswer')
-    type_label_dict = {number: label for number, label in QuestionType.CHOICES}
-    type_label = type_label_dict[type]
     return Subquery(
         StayAnswer
         .objects
         .filter(stay_id=OuterRef('id'), question__label=label)
-        .values(f'{type_label}_value')[:1]
+        .values(VALUE_FIELD_FOR_QUESTION_TYPE[type])[:1]
     )
 
 
+@lru_cache(maxsize=None)
 def choice_q(label):
     """ Annotate the stay with the title of the choice selected for the stay for the answer to the
         question with label == `label`.
     """
     StayAnswer = apps.get_model('stays', 'StayAnswer')
-    QuestionChoice = apps.get_model('stays', 'QuestionChoice')
     return Subquery(
         StayAnswer
         .objects
@@ -445,53 +499,30 @@ def choice_q(label):
             stay_id=OuterRef('id'),
             question__label=label,
         )
-        .annotate(
-            ct=(
-                Subquery(
-                    QuestionChoice
-                    .objects
-                    .filter(
-                        question_id=OuterRef('question_id'),
-                        id=OuterRef('choice_value')
-                    )
-                    .values('title')
-                    [:1]
-                )
-            )
-        )
-        .values('ct')
+        # Join the choice directly rather than nesting another subquery to get its title
+        .values('choice_value__title')
         [:1],
         output_field=models.CharField()
     )
 
 
+@lru_cache(maxsize=None)
 def list_q(label):
     """ Annotate the stay with an array containing the titles of all choices selected
         for the stay.
     """
     StayAnswer = apps.get_model('stays', 'StayAnswer')
-    QuestionChoice = apps.get_model('stays', 'QuestionChoice')
-    return Subquery(
+    # Read the selected choices straight from the `list_value` ManyToMany table, joining the answer
+    # (to filter by stay and question) and the choice (for its title) rather than nesting subqueries
+    return Array(
         StayAnswer
+        .list_value
+        .through
         .objects
         .filter(
-            stay_id=OuterRef('id'),
-            question__title=label,
+            stayanswer__stay_id=OuterRef('id'),
+            stayanswer__question__label=label,
         )
-        .annotate(
-            selected_choice_titles=(
-                Array(
-                    QuestionChoice
-                    .objects
-                    .filter(
-                        question_id=OuterRef('question_id'),
-                        id__any=OuterRef('list_value'),
-                    )
-                    .values('title'),
-                )
-            )
-        )
-        .values('selected_choice_titles')
-        [:1],
+        .values('questionchoice__title'),
         output_field=models.CharField()
-     )
+    )
@@ -1,5 +1,6 @@
 import calendar
 
+from django.core.cache import cache
 from django.db.models import (
     Count,
     Q,
@@ -13,29 +14,20 @@ from stays.models import Stay
 
 
 class StrokeChartDataView(View):
+    # The charts can be a few minutes out of date, so the aggregated data is cached rather than recalculated per request
+    CACHE_TIMEOUT = 10 * 60
+
     def get(self, request):
         """ Returns all data necessary to draw charts for breakdown of stroke cases, month by month in the year to date.
         """
         now = timezone.localtime()
 
-        # Get the first stay of the year to exclude earlier months when the system wasn't running
-        first_stay = (
-            Stay
-            .objects
-            .filter(admission_time__year=now.year)
-            .order_by('admission_time')
-            .first()
-        )
-        if first_stay:
-            first_start_time = first_stay.admission_time
-            if first_start_time.year == now.year:
-                first_month = first_start_time.month
+        # Add in the stroke unit access data
+        first_month, stroke_unit_access_data, stroke_unit_access_percentage = self.stroke_unit_access_data(now)
 
         # List of month names in year to date, used as labels on the front end
-        months = [calendar.month_name[i] for i in range(first_month or 1, now.month + 1)]
+        months = [calendar.month_name[i] for i in range(first_month, now.month + 1)]
 
-        # Add in the stroke unit access data
-        stroke_unit_access_data, stroke_unit_access_percentage = self.stroke_unit_access_data()
         data = {
             'months': months,
             'stroke_unit_access': stroke_unit_access_data,
@@ -44,19 +36,28 @@ class StrokeChartDataView(View):
 
         return JsonResponse(data)
 
-    def stroke_unit_access_data(self):
-        """ Returns a tuple of the list of percentages of stays that had appropriate access to the stroke unit
-            and the year to date percentage.
-            Each entry in the list corresponds to a month in the year to date: e.g. [71.5, 95.2, ...]
+    def stroke_unit_access_data(self, now):
+        """ Returns a tuple of the first month with data, the list of percentages of stays that had appropriate
+            access to the stroke unit and the year to date percentage.
+            Each entry in the list corresponds to a month from the first month to the current month,
+            e.g. [71.5, 95.2, ...]. Earlier months are excluded as the system wasn't running yet.
 
             We look at all stroke stays and exclude stays that were:
                 - made palliative in the first 24 hours,
                 - isolated for infectious contact precautions,
                 - transferred back to the hospital > 1 week after stroke onset,
                 - transferred out of the hospital and did not return,
+
+            `now` is passed in by the view so the whole response uses the same time.
         """
-        now = timezone.localtime()
+        # The data covers the year to date so it's cached per month
+        return cache.get_or_set(
+            f'stroke-unit-access-data-{now:%Y-%m}',
+            lambda: self._calculate_stroke_unit_access_data(now),
+            timeout=self.CACHE_TIMEOUT,
+        )
 
+    def _calculate_stroke_unit_access_data(self, now):
         valid_annotated_stays = (
             Stay
             .neurology_stays
@@ -84,14 +85,23 @@ class StrokeChartDataView(View):
         # Create a list of length $NUMBER_OF_MONTHS_SO_FAR_THIS_YEAR
         stroke_counts_by_month = [None] * now.month
 
-        # Calculate the percentage of stays that had stroke unit access each month
+        # Calculate the percentage of stays that had stroke unit access each month,
+        # keeping running totals for the year to date percentage as we go
+        first_month = None
+        total_access_count = 0
+        total_count = 0
         for entry in access_to_su_counts:
+            # Entries are ordered by month so the first one is the first month with data
+            first_month = first_month or entry['month'].month
             index = entry['month'].month - 1
             stroke_counts_by_month[index] = round(entry['had_access_count']*100/entry['total'], 1)
+            total_access_count += entry['had_access_count']
+            total_count += entry['total']
 
         # Calculate the year to date percentage
-        total_access_count = sum([d['had_access_count'] for d in access_to_su_counts])
-        total_count = sum([d['total'] for d in access_to_su_counts])
         year_to_date_percentage = round((total_access_count*100/total_count) if total_count > 0 else 0, 1)
 
-        return stroke_counts_by_month, year_to_date_percentage
+        # Show the whole year to date if there's no data yet
+        first_month = first_month or 1
+
+        return first_month, stroke_counts_by_month[first_month - 1:], year_to_date_percentage